@@ -1,10 +1,66 @@
+import contextlib
+import functools
+import mmap
 import os
-import pickle
-from Bio import SeqIO
-from datasketch import HyperLogLog
+from concurrent.futures import ProcessPoolExecutor
+from Bio.SeqIO.FastaIO import SimpleFastaParser
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import dendrogram, linkage
+from scipy.spatial.distance import squareform
+
+try:
+    from numba import config, get_num_threads, njit, prange, set_num_threads
+    from numba.typed import List
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit when numba is not installed; returns the function unchanged.
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Lookup table mapping ASCII bytes to 2-bit nucleotide codes, built once at
+# import; numba freezes it into the kernels as a constant. Soft-masked
+# (lowercase) bases encode like uppercase ones, line breaks and spaces are
+# skipped (as SimpleFastaParser strips them) and
+# any other byte (N, IUPAC ambiguity codes, ...) resets the rolling hash.
+_SKIP_CODE = 254
+_INVALID_CODE = 255
+_BASE_LUT = np.full(256, _INVALID_CODE, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    _BASE_LUT[_base] = _code
+    _BASE_LUT[_base | 0x20] = _code
+_BASE_LUT[list(b"\r\n ")] = _SKIP_CODE
+
+# Default HLL precision; sketches have 2**DEFAULT_PRECISION registers.
+DEFAULT_PRECISION = 14
+
+# File names of an HLL collection inside an HLL directory: the registers of all
+# strains back to back, and an index of each strain's name and byte offset.
+REGISTERS_FILE = "registers.bin"
+INDEX_FILE = "index.npy"
+_INDEX_DTYPE = np.dtype([('name', 'S64'), ('offset', 'i8')])
+
+# Sequence bytes hashed per window in _create_hll_from_buffer; the window's
+# uint64 hashes (512 KB) plus the HLL registers stay resident in L2 cache.
+KMER_CHUNK = 1 << 16
+
+# Upper bound on the union registers materialised per block by the numpy
+# fallback of _pairwise_union_cardinalities.
+_DISTANCE_BLOCK_BYTES = 1 << 22
+
+# Register bytes per tile in _pairwise_union_sums, sized to the L1 data cache.
+_L1_TILE_BYTES = 32 * 1024
+
+# FASTA files mapped at once per Numba thread in create_hlls_from_fasta_dir;
+# bounds the open maps so large directories stay within the fd limit.
+_FASTA_BATCH_PER_THREAD = 4
 
 def extract_kmers(sequence, k):
     """
@@ -19,6 +75,645 @@ def extract_kmers(sequence, k):
     """
     return [sequence[i:i + k] for i in range(len(sequence) - k + 1)]
 
+@njit(cache=True)
+def _splitmix64(x):
+    """
+    Scramble a 64-bit integer with the splitmix64 finalizer.
+
+    Packed k-mer encodings leave their high bits mostly zero, so they are mixed
+    before the top bits are used to select an HLL register.
+
+    Args:
+        x (numpy.uint64): The value to mix.
+
+    Returns:
+        numpy.uint64: The mixed value.
+    """
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+@njit(cache=True)
+def _seq_to_kmer_hashes(buf, k, state):
+    """
+    Compute a 64-bit hash of the canonical form of every k-mer in a sequence.
+
+    The 2-bit packed encodings of the k-mer and of its reverse complement are
+    maintained as rolling hashes, so each position costs O(1) instead of O(k).
+    The smaller of the two is the canonical k-mer, which makes the result
+    independent of strand. Line breaks are skipped and windows containing any
+    other non-ACGT byte are dropped.
+
+    The rolling state is carried in `state`, so a long sequence can be hashed
+    as consecutive windows without losing k-mers that span a window boundary.
+
+    Args:
+        buf (numpy.ndarray): The sequence as a uint8 array of ASCII bytes.
+        k (int): The length of k-mers (at most 32).
+        state (numpy.ndarray): A uint64 array of [forward, reverse complement,
+            run length], zeroed for a new sequence and updated in place.
+
+    Returns:
+        numpy.ndarray: A uint64 array with one entry per valid k-mer.
+    """
+    n = buf.shape[0]
+    out = np.empty(n, dtype=np.uint64)
+    mask = np.uint64(0xFFFFFFFFFFFFFFFF) >> np.uint64(64 - 2 * k)
+    rc_shift = np.uint64(2 * (k - 1))
+    h = state[0]
+    h_rc = state[1]
+    valid = np.int64(state[2])
+    count = 0
+    for i in range(n):
+        code = _BASE_LUT[buf[i]]
+        if code == _SKIP_CODE:
+            continue
+        if code == _INVALID_CODE:
+            h = np.uint64(0)
+            h_rc = np.uint64(0)
+            valid = 0
+            continue
+        h = ((h << np.uint64(2)) | np.uint64(code)) & mask
+        # The complement of a 2-bit code is 3 - code; it enters at the high end.
+        h_rc = (h_rc >> np.uint64(2)) | (np.uint64(3 - code) << rc_shift)
+        valid += 1
+        if valid >= k:
+            out[count] = _splitmix64(min(h, h_rc))
+            count += 1
+    state[0] = h
+    state[1] = h_rc
+    state[2] = np.uint64(valid)
+    return out[:count]
+
+@njit(cache=True)
+def _hll_update_from_hashes(reg, hashes, p):
+    """
+    Update HLL registers in place from an array of k-mer hashes.
+
+    The top p bits of each hash select the register and the rank is one plus
+    the number of leading zeros in the remaining bits.
+
+    Args:
+        reg (numpy.ndarray): The HLL register array of length 2**p.
+        hashes (numpy.ndarray): A uint64 array of k-mer hashes.
+        p (int): The HLL precision.
+    """
+    idx_shift = np.uint64(64 - p)
+    p_shift = np.uint64(p)
+    guard = np.uint64(1) << np.uint64(p - 1)
+    top_bit = np.uint64(1) << np.uint64(63)
+    for i in range(hashes.shape[0]):
+        x = hashes[i]
+        idx = x >> idx_shift
+        w = (x << p_shift) | guard
+        rank = 1
+        while (w & top_bit) == 0:
+            w <<= np.uint64(1)
+            rank += 1
+        if rank > reg[idx]:
+            reg[idx] = rank
+
+def _seq_to_kmer_hashes_numpy(buf, k, state):
+    """
+    Vectorised numpy equivalent of _seq_to_kmer_hashes, used without numba.
+
+    Builds the forward and reverse-complement encodings of all windows at once
+    with k shifted passes over the code array instead of a per-byte loop. The
+    last k - 1 bases carried in `state` are decoded and prepended.
+
+    Args:
+        buf (numpy.ndarray): The sequence as a uint8 array of ASCII bytes.
+        k (int): The length of k-mers (at most 32).
+        state (numpy.ndarray): A uint64 array of [forward, reverse complement,
+            run length], zeroed for a new sequence and updated in place.
+
+    Returns:
+        numpy.ndarray: A uint64 array with one entry per valid k-mer.
+    """
+    codes = _BASE_LUT[buf]
+    codes = codes[codes != _SKIP_CODE]
+    run = int(state[2])
+    carry = min(run, k - 1)
+    carried = (state[0] >> (np.uint64(2) * np.arange(carry - 1, -1, -1, dtype=np.uint64))) & np.uint64(3)
+    codes = np.concatenate((carried.astype(np.uint8), codes))
+
+    invalid_positions = np.flatnonzero(codes == _INVALID_CODE)
+    if invalid_positions.size:
+        run = codes.shape[0] - invalid_positions[-1] - 1
+    else:
+        run += codes.shape[0] - carry
+    h = 0
+    h_rc = 0
+    for code in codes[max(codes.shape[0] - min(run, k), 0):]:
+        h = ((h << 2) | int(code)) & ((1 << (2 * k)) - 1)
+        h_rc = (h_rc >> 2) | ((3 - int(code)) << (2 * (k - 1)))
+    state[:] = (h, h_rc, run)
+
+    n = codes.shape[0] - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    num_invalid = np.concatenate(([0], np.cumsum(codes == _INVALID_CODE)))
+    valid = num_invalid[k:] == num_invalid[:-k]
+    codes = codes.astype(np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        window = codes[j:j + n]
+        forward = (forward << np.uint64(2)) | window
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+    # Windows holding an invalid code have garbage encodings but are dropped here.
+    canonical = np.minimum(forward, reverse)[valid]
+    return getattr(_splitmix64, "py_func", _splitmix64)(canonical)
+
+def _hll_update_from_hashes_numpy(reg, hashes, p):
+    """
+    Vectorised numpy equivalent of _hll_update_from_hashes, used without numba.
+
+    Leading zeros are counted with a six-step binary search over all hashes at once.
+
+    Args:
+        reg (numpy.ndarray): The HLL register array of length 2**p.
+        hashes (numpy.ndarray): A uint64 array of k-mer hashes.
+        p (int): The HLL precision.
+    """
+    idx = (hashes >> np.uint64(64 - p)).astype(np.intp)
+    w = (hashes << np.uint64(p)) | np.uint64(1 << (p - 1))
+    rank = np.ones(w.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high_zero = (w >> np.uint64(64 - shift)) == 0
+        rank[high_zero] += shift
+        w = np.where(high_zero, w << np.uint64(shift), w)
+    np.maximum.at(reg, idx, rank)
+
+def _check_k(k):
+    """
+    Check that k-mers of length k fit in the 64-bit rolling hash.
+
+    Args:
+        k (int): The length of k-mers.
+
+    Raises:
+        ValueError: If k is not between 1 and 32.
+    """
+    if not 1 <= k <= 32:
+        raise ValueError(f"k must be between 1 and 32, got {k}")
+
+@functools.lru_cache(maxsize=None)
+def _kmer_hash_kernel(k):
+    """
+    Return a k-mer hashing function with k fixed at compile time.
+
+    With numba, k is captured as a closure constant and _seq_to_kmer_hashes is
+    inlined, so the mask and shifts of the rolling hash become immediates.
+
+    Args:
+        k (int): The length of k-mers (at most 32).
+
+    Returns:
+        callable: A function (buf, state) -> hashes, as _seq_to_kmer_hashes.
+    """
+    _check_k(k)
+
+    @njit(cache=True)
+    def kernel(buf, state):
+        return _seq_to_kmer_hashes(buf, k, state)
+    return kernel
+
+@njit(nogil=True, cache=True)
+def _update_registers_from_fasta(reg, buf, k, p):
+    """
+    Add the k-mers of every record in raw FASTA bytes to HLL registers.
+
+    Header lines are skipped and the rolling hash is reset at each record, so
+    the result matches parsing the records and merging their sketches. Text
+    before the first header is ignored, as SimpleFastaParser does. Callers go
+    through _fasta_kernels, which fixes k at compile time.
+
+    Args:
+        reg (numpy.ndarray): The HLL register array of length 2**p, updated in place.
+        buf (numpy.ndarray): The FASTA file contents as a uint8 array.
+        k (int): The length of k-mers (at most 32).
+        p (int): The HLL precision.
+    """
+    n = buf.shape[0]
+    state = np.zeros(3, dtype=np.uint64)
+    pos = 0
+    while pos < n:
+        if buf[pos] != 62 or (pos > 0 and buf[pos - 1] != 10):
+            pos += 1
+            continue
+        # pos is at a '>' starting a line: skip the header, then find the next record.
+        while pos < n and buf[pos] != 10:
+            pos += 1
+        end = pos
+        while end < n and not (buf[end] == 62 and buf[end - 1] == 10):
+            end += 1
+        state[:] = 0
+        for start in range(pos, end, KMER_CHUNK):
+            hashes = _seq_to_kmer_hashes(buf[start:min(start + KMER_CHUNK, end)], k, state)
+            _hll_update_from_hashes(reg, hashes, p)
+        pos = end
+
+@functools.lru_cache(maxsize=None)
+def _fasta_kernels(k):
+    """
+    Return FASTA scanning functions with k fixed at compile time.
+
+    As with _kmer_hash_kernel, k is captured as a closure constant and the
+    rolling hash inlined through _update_registers_from_fasta is compiled
+    with immediate masks and shifts for this k.
+
+    Args:
+        k (int): The length of k-mers (at most 32).
+
+    Returns:
+        tuple: A function (reg, buf, p) that adds one FASTA buffer to a register
+        array in place, and a function (registers, buffers, p) that adds each
+        buffer of a numba.typed.List to the matching row of a register matrix
+        in place, scanning the files in parallel, one per thread.
+    """
+    _check_k(k)
+
+    @njit(nogil=True, cache=True)
+    def update_registers(reg, buf, p):
+        _update_registers_from_fasta(reg, buf, k, p)
+
+    @njit(parallel=True, nogil=True, cache=True)
+    def update_registers_many(registers, buffers, p):
+        for i in prange(len(buffers)):
+            # prange yields an unsigned index; typed lists are indexed with signed ints.
+            _update_registers_from_fasta(registers[i], buffers[np.int64(i)], k, p)
+
+    return update_registers, update_registers_many
+
+@contextlib.contextmanager
+def _map_file(file_path):
+    """
+    Memory-map a file read-only as a uint8 array for the duration of a with block.
+
+    The file itself is closed as soon as it is mapped, since the map holds its
+    own descriptor. The map is closed on exit, so every view of the yielded
+    array must be released before the block ends.
+
+    Args:
+        file_path (str): The file to map.
+
+    Yields:
+        numpy.ndarray: The file contents as a read-only uint8 array.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            mm = None
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm is None:
+        yield np.frombuffer(b"", dtype=np.uint8)
+        return
+    yield np.frombuffer(mm, dtype=np.uint8)
+    # Not reached if the block raised: its traceback may still hold a view,
+    # so the map is then left to the garbage collector rather than letting
+    # a BufferError from close() mask the original exception.
+    mm.close()
+
+if _NUMBA_AVAILABLE:
+    # Compile (or load from cache) at import so the first sequence does not pay for it.
+    _kmer_hash_kernel(31)(np.frombuffer(b"A", dtype=np.uint8), np.zeros(3, dtype=np.uint64))
+    _hll_update_from_hashes(np.zeros(1 << 4, dtype=np.uint8), np.zeros(1, dtype=np.uint64), 4)
+else:
+    # The per-byte kernels above would run as interpreted Python; use the
+    # vectorised numpy equivalents, which produce identical hashes.
+    _seq_to_kmer_hashes = _seq_to_kmer_hashes_numpy
+    _hll_update_from_hashes = _hll_update_from_hashes_numpy
+
+# 2**-rank for every possible register value, so the estimator gathers from a
+# table instead of evaluating a power per register.
+_POW2NEG = np.ldexp(1.0, -np.arange(256))
+
+def _estimate_cardinality(reg):
+    """
+    Apply the HyperLogLog estimator, with linear counting for small cardinalities.
+
+    Args:
+        reg (numpy.ndarray): Register arrays of length m along the last axis.
+
+    Returns:
+        numpy.ndarray: The estimated cardinality of each register array.
+    """
+    m = reg.shape[-1]
+    inverse_sum = np.sum(_POW2NEG[reg], axis=-1)
+    num_zero = m - np.count_nonzero(reg, axis=-1)
+    return _estimate_from_sums(inverse_sum, num_zero, m)
+
+def _estimate_from_sums(inverse_sum, num_zero, m):
+    """
+    Apply the HyperLogLog estimator to precomputed register statistics.
+
+    Args:
+        inverse_sum (numpy.ndarray): The sums of 2**-register over each register array.
+        num_zero (numpy.ndarray): The number of zero registers in each register array.
+        m (int): The number of registers per array.
+
+    Returns:
+        numpy.ndarray: The estimated cardinality of each register array.
+    """
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / inverse_sum
+    linear = m * np.log(m / np.maximum(num_zero, 1))
+    return np.where((estimate <= 2.5 * m) & (num_zero > 0), linear, estimate)
+
+def _pack_registers(registers):
+    """
+    Pack register rows two per byte.
+
+    Register 2i goes to the low nibble and register 2i + 1 to the high nibble
+    of byte i, halving the bytes the pairwise kernel has to stream. Ranks above
+    15 need over 2**14 elements in one register at p=14, so this is lossless
+    for all but the largest sets; callers must check every rank fits in 4 bits.
+
+    Args:
+        registers (numpy.ndarray): An (n, m) uint8 register matrix with ranks of at most 15.
+
+    Returns:
+        numpy.ndarray: An (n, m // 2) uint8 matrix of packed registers.
+    """
+    return registers[:, 0::2] | (registers[:, 1::2] << 4)
+
+# Sum of 2**-register and number of zero registers for each packed byte value.
+_PACKED_INVERSE_SUM = _POW2NEG[np.arange(256) & 15] + _POW2NEG[np.arange(256) >> 4]
+_PACKED_NUM_ZERO = ((np.arange(256) & 15) == 0).astype(np.int64) + ((np.arange(256) >> 4) == 0)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _pairwise_union_sums(packed, block, tiles, inverse_sum_lut, num_zero_lut):
+    """
+    Compute the HLL estimator statistics of the union of every pair of register rows.
+
+    Pairs are visited in block x block tiles so that a tile's register rows stay
+    in L1 cache while they are compared; the tiles of the upper triangle are
+    spread evenly over threads.
+    Rows are read as uint64 words of 16 packed registers; the nibbles are split
+    into byte lanes and maxed with a borrow-free SWAR compare.
+
+    Args:
+        packed (numpy.ndarray): An (n, w) uint64 matrix of 4-bit packed registers.
+        block (int): The number of rows per tile.
+        tiles (numpy.ndarray): The (row block, column block) pairs to visit, from _upper_tiles.
+        inverse_sum_lut (numpy.ndarray): The sum of 2**-register per packed byte value.
+        num_zero_lut (numpy.ndarray): The number of zero registers per packed byte value.
+
+    Returns:
+        tuple: (n, n) arrays with the sum of 2**-register and the number of zero
+        registers of each pairwise union; only the upper triangle is filled.
+    """
+    n, w = packed.shape
+    low = np.uint64(0x0F0F0F0F0F0F0F0F)
+    high_bit = np.uint64(0x8080808080808080)
+    inverse_sum = np.zeros((n, n))
+    num_zero = np.zeros((n, n), dtype=np.int64)
+    for t in prange(tiles.shape[0]):
+        ii = tiles[t, 0] * block
+        jj = tiles[t, 1] * block
+        for i in range(ii, min(ii + block, n)):
+            for j in range(max(jj, i + 1), min(jj + block, n)):
+                total = 0.0
+                zeros = 0
+                for r in range(w):
+                    a = packed[i, r]
+                    b = packed[j, r]
+                    v = np.uint64(0)
+                    for shift in (np.uint64(0), np.uint64(4)):
+                        x = (a >> shift) & low
+                        y = (b >> shift) & low
+                        # Each byte lane holds at most 15, so setting its top bit
+                        # before subtracting leaves it set exactly where x >= y.
+                        ge = (((x | high_bit) - y) & high_bit) >> np.uint64(7)
+                        ge *= np.uint64(0xFF)
+                        v |= ((x & ge) | (y & ~ge)) << shift
+                    for byte in range(8):
+                        value = (v >> np.uint64(8 * byte)) & np.uint64(0xFF)
+                        total += inverse_sum_lut[value]
+                        zeros += num_zero_lut[value]
+                inverse_sum[i, j] = total
+                num_zero[i, j] = zeros
+    return inverse_sum, num_zero
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _pairwise_union_sums_unpacked(registers, block, tiles, pow2neg):
+    """
+    Compute the HLL estimator statistics of the union of every pair of register rows.
+
+    The one-register-per-byte counterpart of _pairwise_union_sums, used when
+    some rank does not fit in 4 bits.
+
+    Args:
+        registers (numpy.ndarray): An (n, m) uint8 register matrix.
+        block (int): The number of rows per tile.
+        tiles (numpy.ndarray): The (row block, column block) pairs to visit, from _upper_tiles.
+        pow2neg (numpy.ndarray): 2**-r for every possible register value r.
+
+    Returns:
+        tuple: (inverse_sum, num_zero) (n, n) matrices, filled above the diagonal only.
+    """
+    n, m = registers.shape
+    inverse_sum = np.zeros((n, n))
+    num_zero = np.zeros((n, n), dtype=np.int64)
+    for t in prange(tiles.shape[0]):
+        ii = tiles[t, 0] * block
+        jj = tiles[t, 1] * block
+        for i in range(ii, min(ii + block, n)):
+            for j in range(max(jj, i + 1), min(jj + block, n)):
+                total = 0.0
+                zeros = 0
+                for r in range(m):
+                    value = max(registers[i, r], registers[j, r])
+                    total += pow2neg[value]
+                    zeros += value == 0
+                inverse_sum[i, j] = total
+                num_zero[i, j] = zeros
+    return inverse_sum, num_zero
+
+def _upper_tiles(n, block):
+    """
+    List the block x block tiles covering the upper triangle of an n x n matrix.
+
+    Iterating over this flat list, rather than over row blocks, gives every
+    thread a similar amount of work: row block 0 has n / block tiles to its
+    right while the last row block has only one.
+
+    Args:
+        n (int): The number of rows.
+        block (int): The number of rows per tile.
+
+    Returns:
+        numpy.ndarray: An (n_tiles, 2) int64 array of (row block, column block) pairs.
+    """
+    row_blocks, col_blocks = np.triu_indices((n + block - 1) // block)
+    return np.stack([row_blocks, col_blocks], axis=1).astype(np.int64)
+
+def _pairwise_union_cardinalities(registers):
+    """
+    Estimate the cardinality of the union of every pair of register rows.
+
+    Uses the tiled Numba kernel over 4-bit packed registers when numba is
+    available and every rank fits in 4 bits, the unpacked kernel when one does
+    not, and otherwise compares blocks of rows against all rows with numpy
+    broadcasting.
+
+    Args:
+        registers (numpy.ndarray): An (n, m) uint8 register matrix.
+
+    Returns:
+        numpy.ndarray: An (n, n) matrix of union cardinality estimates.
+    """
+    n, m = registers.shape
+    if _NUMBA_AVAILABLE:
+        if m % 16 == 0 and registers.max(initial=0) <= 15:
+            packed = np.ascontiguousarray(_pack_registers(registers)).view(np.uint64)
+            block = max(1, _L1_TILE_BYTES // packed.shape[1] // 8)
+            inverse_sum, num_zero = _pairwise_union_sums(
+                packed, block, _upper_tiles(n, block), _PACKED_INVERSE_SUM, _PACKED_NUM_ZERO
+            )
+        else:
+            registers = np.ascontiguousarray(registers)
+            block = max(1, _L1_TILE_BYTES // m)
+            inverse_sum, num_zero = _pairwise_union_sums_unpacked(registers, block, _upper_tiles(n, block), _POW2NEG)
+        # Fill the lower triangle and diagonal so the estimator sees valid sums everywhere.
+        inverse_sum += inverse_sum.T
+        num_zero += num_zero.T
+        np.fill_diagonal(inverse_sum, 1.0)
+        np.fill_diagonal(num_zero, 0)
+        return _estimate_from_sums(inverse_sum, num_zero, m)
+
+    # Compare a block of rows against all strains at once, sized so the
+    # broadcast union registers stay within _DISTANCE_BLOCK_BYTES.
+    union = np.empty((n, n))
+    block = max(1, _DISTANCE_BLOCK_BYTES // registers.nbytes)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        union[start:stop] = _estimate_cardinality(np.maximum(registers[start:stop, None, :], registers[None, :, :]))
+    return union
+
+def _distance_from_cardinalities(card_a, card_b, card_union):
+    """
+    Estimate Jaccard distances directly as (2|A u B| - |A| - |B|) / |A u B|.
+
+    Equivalent to 1 minus _jaccard_from_cardinalities without forming the
+    similarity first.
+
+    Args:
+        card_a (numpy.ndarray): Cardinality estimates of the first sets.
+        card_b (numpy.ndarray): Cardinality estimates of the second sets.
+        card_union (numpy.ndarray): Cardinality estimates of their unions.
+
+    Returns:
+        numpy.ndarray: The estimated Jaccard distances in [0, 1]; 1 where the union is empty.
+    """
+    distance = np.divide(2 * card_union - card_a - card_b, card_union, out=np.ones(np.shape(card_union)), where=card_union > 0)
+    return np.clip(distance, 0.0, 1.0)
+
+def _jaccard_from_cardinalities(card_a, card_b, card_union):
+    """
+    Estimate Jaccard similarities by inclusion-exclusion, clipped to [0, 1].
+
+    Args:
+        card_a (numpy.ndarray): Cardinality estimates of the first sets.
+        card_b (numpy.ndarray): Cardinality estimates of the second sets.
+        card_union (numpy.ndarray): Cardinality estimates of their unions.
+
+    Returns:
+        numpy.ndarray: The estimated Jaccard similarities; 0 where the union is empty.
+    """
+    intersection = card_a + card_b - card_union
+    jaccard = np.divide(intersection, card_union, out=np.zeros(np.shape(card_union)), where=card_union > 0)
+    return np.clip(jaccard, 0.0, 1.0)
+
+class FastHLL:
+    """
+    A minimal HyperLogLog sketch over 64-bit k-mer hashes.
+
+    The state is a single uint8 register array, so merging and comparing
+    sketches are plain numpy operations. The cardinality estimate is cached
+    until the sketch is updated or merged; modify reg only through those methods.
+    A read-only reg (e.g. a memory-mapped file) is copied on the first update.
+
+    Attributes:
+        p (int): The precision; the sketch has 2**p registers.
+        m (int): The number of registers.
+        reg (numpy.ndarray): The uint8 register array.
+    """
+
+    def __init__(self, p=DEFAULT_PRECISION, reg=None):
+        """
+        Create an empty sketch, or wrap an existing register array.
+
+        Args:
+            p (int, optional): The precision. Defaults to 14. Ignored if reg is given.
+            reg (numpy.ndarray, optional): An existing register array of length 2**p.
+        """
+        if reg is None:
+            reg = np.zeros(1 << p, dtype=np.uint8)
+        else:
+            p = reg.shape[0].bit_length() - 1
+            if reg.shape[0] != 1 << p:
+                raise ValueError("The register array length must be a power of 2.")
+        self.p = p
+        self.m = 1 << p
+        self.reg = reg
+        self._count = None
+
+    def update_from_hashes(self, hashes):
+        """
+        Add a batch of k-mer hashes to the sketch.
+
+        Read-only registers, such as the memory-mapped ones returned by
+        load_existing_hlls, are copied first so the file is never written.
+
+        Args:
+            hashes (numpy.ndarray): A uint64 array of k-mer hashes.
+        """
+        if not self.reg.flags.writeable:
+            self.reg = self.reg.copy()
+        _hll_update_from_hashes(self.reg, hashes, self.p)
+        self._count = None
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one in place.
+
+        Args:
+            other (FastHLL): The sketch to merge; must have the same precision.
+        """
+        if other.p != self.p:
+            raise ValueError("Cannot merge HLLs with different precisions.")
+        self.reg = np.maximum(self.reg, other.reg)
+        self._count = None
+
+    def count(self):
+        """
+        Estimate the number of distinct k-mers added to the sketch.
+
+        Returns:
+            float: The estimated cardinality.
+        """
+        if self._count is None:
+            self._count = float(_estimate_cardinality(self.reg))
+        return self._count
+
+    def jaccard(self, other):
+        """
+        Estimate the Jaccard similarity with another sketch by inclusion-exclusion.
+
+        Args:
+            other (FastHLL): The sketch to compare with; must have the same precision.
+
+        Returns:
+            float: The estimated Jaccard similarity in [0, 1].
+        """
+        if other.p != self.p:
+            raise ValueError("Cannot compare HLLs with different precisions.")
+        union = _estimate_cardinality(np.maximum(self.reg, other.reg))
+        return float(_jaccard_from_cardinalities(self.count(), other.count(), union))
+
 def create_hll_from_sequence(sequence, k=31):
     """
     Create a HyperLogLog (HLL) data structure from a given sequence.
@@ -28,30 +723,160 @@ def create_hll_from_sequence(sequence, k=31):
         k (int, optional): The length of k-mers. Defaults to 31.
 
     Returns:
-        HyperLogLog: The HLL representation of the sequence.
+        FastHLL: The HLL representation of the sequence.
+    """
+    return _create_hll_from_buffer(np.frombuffer(sequence.encode('ascii'), dtype=np.uint8), k)
+
+def _create_hll_from_buffer(buf, k):
+    """
+    Create an HLL from a sequence held in a byte buffer, one window at a time.
+
+    Args:
+        buf (numpy.ndarray): The sequence as a uint8 array of ASCII bytes; may
+            contain line breaks.
+        k (int): The length of k-mers.
+
+    Returns:
+        FastHLL: The HLL representation of the sequence.
+    """
+    hll = FastHLL()
+    kernel = _kmer_hash_kernel(k)
+    state = np.zeros(3, dtype=np.uint64)
+    for start in range(0, buf.shape[0], KMER_CHUNK):
+        hll.update_from_hashes(kernel(buf[start:start + KMER_CHUNK], state))
+    return hll
+
+def create_hll_from_fasta(file_path, k=31):
+    """
+    Create a single HLL covering the k-mers of every record in a FASTA file.
+
+    With numba the file is memory-mapped and scanned in place, headers and
+    line breaks included, without parsing it into Python strings. Without
+    numba only single-record files are hashed this way.
+
+    Args:
+        file_path (str): The FASTA file to read.
+        k (int, optional): The length of k-mers. Defaults to 31.
+
+    Returns:
+        FastHLL: The HLL representation of all sequences in the file.
     """
-    hll = HyperLogLog()
-    kmers = extract_kmers(sequence, k)
-    for kmer in kmers:
-        hll.update(kmer.encode('utf8'))
+    # Fail before any map is open, so a bad k is not masked by a BufferError.
+    _check_k(k)
+    if _NUMBA_AVAILABLE:
+        hll = FastHLL()
+        update_registers, _ = _fasta_kernels(k)
+        with _map_file(file_path) as buf:
+            update_registers(hll.reg, buf, hll.p)
+            # Release the view before the map is closed.
+            del buf
+        return hll
+
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:1] == b">" and mm.find(b"\n>") == -1:
+                    header_end = mm.find(b"\n")
+                    if header_end == -1:
+                        return FastHLL()
+                    body = np.frombuffer(mm, dtype=np.uint8)[header_end + 1:]
+                    hll = _create_hll_from_buffer(body, k)
+                    # Release the view before the map is closed.
+                    del body
+                    return hll
+
+    hll = FastHLL()
+    with open(file_path, "r") as handle:
+        for _title, sequence in SimpleFastaParser(handle):
+            hll.merge(create_hll_from_sequence(sequence, k))
     return hll
 
+def create_hlls_from_fasta_dir(fasta_dir, max_workers=None, k=31):
+    """
+    Create HLLs for every FASTA file in a directory in parallel.
+
+    With numba, the files are memory-mapped and hashed on numba's thread pool
+    in batches of a few files per thread. Otherwise they are spread over
+    worker processes.
+
+    Args:
+        fasta_dir (str): The directory containing strain sequences in FASTA format.
+        max_workers (int, optional): The number of numba threads, or of worker
+            processes without numba. Defaults to the number of CPUs; 1 builds
+            the HLLs one file at a time in the current thread.
+        k (int, optional): The length of k-mers. Defaults to 31.
+
+    Returns:
+        dict: A dictionary with strain names as keys and HLLs as values.
+    """
+    strain_names = []
+    file_paths = []
+    for filename in sorted(os.listdir(fasta_dir)):
+        if filename.endswith(".fasta"):
+            strain_names.append(filename.replace(".fasta", ""))
+            file_paths.append(os.path.join(fasta_dir, filename))
+
+    build = functools.partial(create_hll_from_fasta, k=k)
+    if max_workers == 1 or len(file_paths) <= 1:
+        hlls = [build(file_path) for file_path in file_paths]
+    elif _NUMBA_AVAILABLE:
+        _, update_registers_many = _fasta_kernels(k)
+        registers = np.zeros((len(file_paths), 1 << DEFAULT_PRECISION), dtype=np.uint8)
+        previous_threads = get_num_threads()
+        if max_workers is not None:
+            set_num_threads(min(max_workers, config.NUMBA_NUM_THREADS))
+        try:
+            batch = _FASTA_BATCH_PER_THREAD * get_num_threads()
+            for start in range(0, len(file_paths), batch):
+                with contextlib.ExitStack() as maps:
+                    buffers = List(
+                        [maps.enter_context(_map_file(file_path)) for file_path in file_paths[start:start + batch]]
+                    )
+                    update_registers_many(registers[start:start + batch], buffers, DEFAULT_PRECISION)
+                    # Release the views before the maps are closed.
+                    del buffers
+        finally:
+            set_num_threads(previous_threads)
+        hlls = [FastHLL(reg=registers[i]) for i in range(len(file_paths))]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            hlls = list(executor.map(build, file_paths))
+    return dict(zip(strain_names, hlls))
+
 def load_existing_hlls(hll_dir):
     """
     Load existing HLLs from files in a specified directory.
 
+    If the directory holds a collection written by save_hll_collection, its
+    register file is memory-mapped once and every HLL is a slice of that map;
+    otherwise every per-strain .npy file is memory-mapped. The returned HLLs
+    view the files read-only; updating or merging one copies its registers
+    first, so the files are never modified.
+
     Args:
         hll_dir (str): The directory containing HLL files.
 
     Returns:
         dict: A dictionary with strain names as keys and HLLs as values.
     """
+    registers_file = os.path.join(hll_dir, REGISTERS_FILE)
+    index_file = os.path.join(hll_dir, INDEX_FILE)
+    if os.path.exists(registers_file) and os.path.exists(index_file):
+        index = np.load(index_file)
+        if index.shape[0] == 0:
+            return {}
+        registers = np.memmap(registers_file, dtype=np.uint8, mode='r')
+        ends = np.append(index['offset'][1:], registers.shape[0])
+        return {
+            name.decode(): FastHLL(reg=registers[offset:end])
+            for name, offset, end in zip(index['name'], index['offset'], ends)
+        }
+
     hlls = {}
     for filename in os.listdir(hll_dir):
-        if filename.endswith(".hll"):
-            strain_name = filename.replace(".hll", "")
-            with open(os.path.join(hll_dir, filename), "rb") as f:
-                hlls[strain_name] = pickle.load(f)
+        if filename.endswith(".npy") and filename != INDEX_FILE:
+            strain_name = filename.replace(".npy", "")
+            hlls[strain_name] = FastHLL(reg=np.load(os.path.join(hll_dir, filename), mmap_mode='r'))
     return hlls
 
 def save_hll(hll, filename):
@@ -59,18 +884,37 @@ def save_hll(hll, filename):
     Save an HLL to a file.
 
     Args:
-        hll (HyperLogLog): The HLL to save.
-        filename (str): The file to save the HLL to.
+        hll (FastHLL): The HLL to save.
+        filename (str): The .npy file to save the HLL registers to.
     """
-    with open(filename, "wb") as f:
-        pickle.dump(hll, f)
+    np.save(filename, hll.reg)
+
+def save_hll_collection(hlls, hll_dir):
+    """
+    Save several HLLs to one contiguous register file plus a name/offset index.
+
+    Args:
+        hlls (dict): A dictionary with strain names as keys and HLLs as values.
+        hll_dir (str): The directory to save the collection to.
+    """
+    index = np.zeros(len(hlls), dtype=_INDEX_DTYPE)
+    offset = 0
+    with open(os.path.join(hll_dir, REGISTERS_FILE), "wb") as f:
+        for i, (strain_name, hll) in enumerate(hlls.items()):
+            encoded_name = strain_name.encode()
+            if len(encoded_name) > _INDEX_DTYPE['name'].itemsize:
+                raise ValueError(f"Strain name is too long for the HLL index: {strain_name}")
+            index[i] = (encoded_name, offset)
+            f.write(hll.reg.tobytes())
+            offset += hll.reg.nbytes
+    np.save(os.path.join(hll_dir, INDEX_FILE), index)
 
 def compare_with_existing_strains(new_hll, existing_hlls):
     """
     Compare a new strain's HLL with existing strains' HLLs.
 
     Args:
-        new_hll (HyperLogLog): The HLL of the new strain.
+        new_hll (FastHLL): The HLL of the new strain.
         existing_hlls (dict): A dictionary with strain names as keys and HLLs as values.
 
     Returns:
@@ -95,15 +939,14 @@ def create_distance_matrix(existing_hlls):
     strain_names = list(existing_hlls.keys())
     num_strains = len(strain_names)
     distance_matrix = np.zeros((num_strains, num_strains))
+    if num_strains == 0:
+        return distance_matrix, strain_names
 
-    for i in range(num_strains):
-        for j in range(i + 1, num_strains):
-            hll1 = existing_hlls[strain_names[i]]
-            hll2 = existing_hlls[strain_names[j]]
-            jaccard_similarity = hll1.jaccard(hll2)
-            distance = 1 - jaccard_similarity
-            distance_matrix[i, j] = distance
-            distance_matrix[j, i] = distance
+    registers = np.stack([existing_hlls[name].reg for name in strain_names])
+    cardinalities = np.array([existing_hlls[name].count() for name in strain_names])
+    union = _pairwise_union_cardinalities(registers)
+    distance_matrix = _distance_from_cardinalities(cardinalities[:, None], cardinalities[None, :], union)
+    np.fill_diagonal(distance_matrix, 0.0)
 
     return distance_matrix, strain_names
 
@@ -116,7 +959,9 @@ def plot_dendrogram(distance_matrix, strain_names, output_file):
         strain_names (list): The list of strain names.
         output_file (str): The file to save the dendrogram plot.
     """
-    linkage_matrix = linkage(distance_matrix, method='average')
+    # linkage expects a condensed distance vector; a square matrix would be
+    # treated as observations.
+    linkage_matrix = linkage(squareform(distance_matrix, checks=False), method='average')
     plt.figure(figsize=(10, 7))
     dendrogram(linkage_matrix, labels=strain_names, leaf_rotation=90, leaf_font_size=10)
     plt.title('Phylogenetic Tree (Cladogram) of Flu Strains')
@@ -139,22 +984,13 @@ def main():
 
     # Step 1: Create and save HLLs for existing strains (run once)
     os.makedirs(hll_dir, exist_ok=True)
-    for filename in os.listdir(existing_strains_dir):
-        if filename.endswith(".fasta"):
-            strain_name = filename.replace(".fasta", "")
-            file_path = os.path.join(existing_strains_dir, filename)
-            with open(file_path, "r") as handle:
-                for record in SeqIO.parse(handle, "fasta"):
-                    hll = create_hll_from_sequence(str(record.seq))
-                    save_hll(hll, os.path.join(hll_dir, f"{strain_name}.hll"))
+    save_hll_collection(create_hlls_from_fasta_dir(existing_strains_dir), hll_dir)
 
     # Step 2: Load HLLs of existing strains
     existing_hlls = load_existing_hlls(hll_dir)
 
     # Step 3: Create HLL for the new strain
-    with open(new_strain_file, "r") as handle:
-        for record in SeqIO.parse(handle, "fasta"):
-            new_hll = create_hll_from_sequence(str(record.seq))
+    new_hll = create_hll_from_fasta(new_strain_file)
 
     # Step 4: Compare the new strain with existing strains
     similarities = compare_with_existing_strains(new_hll, existing_hlls)